@@ -1,40 +1,156 @@
-import json
+import hashlib
 import os
+import orjson
 import spacy
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from collections import defaultdict
+from spacy.symbols import ADJ, NOUN, PROPN
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from collections import Counter
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 
-# Load spaCy model from specified path
-nlp = spacy.load("./models/en_core_web_lg/en_core_web_lg/en_core_web_lg-3.8.0/")
+# Optional GPU backend for the similarity product; CPU scipy is used when CuPy is not installed
+try:
+    import cupyx.scipy.sparse as cusparse
+except ImportError:
+    cusparse = None
 
-def preprocess_text(text):
-    doc = nlp(text)
-    terms = [token.lemma_.lower() for token in doc if token.pos_ in ["NOUN", "PROPN", "ADJ"] and not token.is_stop]
-    return " ".join(terms)
+# Load spaCy model from specified path; only lemmas, POS tags and stop words are used, so the small model without
+# word vectors is enough, and parser and NER are skipped
+nlp = spacy.load("./models/en_core_web_sm/en_core_web_sm/en_core_web_sm-3.8.0/", disable=["parser", "ner"])
+
+# Parts of speech kept as candidate key terms, as integer symbol IDs to compare against token.pos
+KEY_TERM_POS = frozenset({NOUN, PROPN, ADJ})
+# Work pairs with a cosine similarity at or below this are not linked in the network
+SIMILARITY_THRESHOLD = 0.05
+# Threads used to read metadata files; loading is I/O-bound so threads sidestep the GIL
+LOAD_WORKERS = 16
+# spaCy worker processes for nlp.pipe; kept at 1 because forking from reticulate's embedded interpreter is not portable
+SPACY_N_PROCESS = 1
+# Hashed feature space for TF-IDF; memory is bounded by this rather than by the corpus vocabulary
+HASHING_N_FEATURES = 2 ** 18
+# Corpora with at least this many texts compute the similarity product on the GPU when CuPy is available
+GPU_MIN_TEXTS = 5000
+# Key terms are cached per text content so unchanged abstracts never go back through spaCy
+KEY_TERMS_CACHE_DIR = os.path.join("cache", "key_terms")
+# Anything that changes which terms are extracted goes into the key-term cache key
+KEY_TERMS_CACHE_SALT = f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}|{sorted(KEY_TERM_POS)}"
+
+def _load_json(file_path):
+    with open(file_path, "rb") as f:
+        return orjson.loads(f.read())
+
+def _read_cached_json(path):
+    # Missing, partially written or otherwise unreadable cache files count as a miss
+    try:
+        return _load_json(path)
+    except (OSError, ValueError):
+        return None
+
+def _write_cached_json(path, obj):
+    # Write to a temporary file and swap it in so readers never see a half-written entry; caching failures are not fatal
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(obj))
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _key_terms_from_doc(doc, n=10):
+    lemmas = [token.lemma_.lower() for token in doc if not token.is_stop and token.pos in KEY_TERM_POS]
+    # most_common(n) selects the top n with a heap rather than sorting every distinct term
+    return [term for term, _ in Counter(lemmas).most_common(n)]
 
 def extract_key_terms(text, n=10):
     if not text or text == "No abstract available":
         return []
-    processed_text = preprocess_text(text)
-    doc = nlp(processed_text)
-    terms = [token.text for token in doc]
-    term_freq = defaultdict(int)
-    for term in terms:
-        term_freq[term] += 1
-    sorted_terms = sorted(term_freq.items(), key=lambda x: x[1], reverse=True)
-    return [term for term, _ in sorted_terms[:n]]
+    return _key_terms_from_doc(nlp(text), n)
+
+def _text_cache_path(cache_dir, text, salt):
+    digest = hashlib.blake2b(f"{salt}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, digest + ".json")
+
+def extract_all_key_terms(texts, n=10, n_process=SPACY_N_PROCESS):
+    # Serve cached texts from disk and run the rest through spaCy in one batched pass
+    cache_paths = [_text_cache_path(KEY_TERMS_CACHE_DIR, text, f"{KEY_TERMS_CACHE_SALT}|{n}") for text in texts]
+    key_terms = [_read_cached_json(path) for path in cache_paths]
+    missing = [k for k, terms in enumerate(key_terms) if terms is None]
+    if missing:
+        os.makedirs(KEY_TERMS_CACHE_DIR, exist_ok=True)
+    docs = nlp.pipe((texts[k] for k in missing), batch_size=64, n_process=n_process)
+    for k, doc in zip(missing, docs):
+        key_terms[k] = _key_terms_from_doc(doc, n)
+        _write_cached_json(cache_paths[k], key_terms[k])
+    return key_terms
+
+def _tfidf_matrix(texts):
+    # Stateless hashing replaces the in-memory vocabulary, so there is nothing to persist between runs; IDF weighting
+    # and L2 norm are refitted over the whole corpus
+    vectorizer = HashingVectorizer(n_features=HASHING_N_FEATURES, stop_words="english", alternate_sign=False, norm=None)
+    return TfidfTransformer(norm="l2").fit_transform(vectorizer.transform(texts))
+
+def _sparse_self_product(matrix):
+    # Large corpora go through cuSPARSE when a GPU is usable; any CUDA failure falls back to scipy on the CPU
+    if cusparse is not None and matrix.shape[0] >= GPU_MIN_TEXTS:
+        try:
+            gpu_matrix = cusparse.csr_matrix(matrix)
+            return (gpu_matrix @ gpu_matrix.T).get().tocsr()
+        except Exception:
+            pass
+    return matrix @ matrix.T
 
 def compute_similarity_matrix(texts):
+    # Returns (similarity between distinct texts, groups) where groups[k] lists the input positions holding distinct text k
     if len(texts) < 2:
-        return np.array([])
-    vectorizer = TfidfVectorizer(stop_words="english")
-    tfidf_matrix = vectorizer.fit_transform(texts)
-    similarity_matrix = cosine_similarity(tfidf_matrix)
-    return similarity_matrix
+        return None
+    # Rows are already L2-normalised by the vectorizer, so X @ X.T is the cosine similarity as a sparse CSR matrix
+    tfidf_matrix = _tfidf_matrix(texts)
+    # Duplicate texts give identical rows, so only distinct rows are multiplied; groups map them back to the inputs
+    groups = {}
+    for row, text in enumerate(texts):
+        groups.setdefault(text, []).append(row)
+    groups = list(groups.values())
+    if len(groups) < len(texts):
+        tfidf_matrix = tfidf_matrix[[group[0] for group in groups]]
+    similarity_matrix = _sparse_self_product(tfidf_matrix)
+    return similarity_matrix, groups
 
-def process_json_files(doi_safe, depth_level):
+def _iter_edges(similarity_matrix, groups, file_ids, threshold):
+    # The diagonal is only needed to link works that share one text with each other
+    has_duplicates = any(len(group) > 1 for group in groups)
+    upper = sp.triu(similarity_matrix, k=0 if has_duplicates else 1, format="coo")
+    mask = upper.data > threshold
+    for a, b, weight in zip(upper.row[mask], upper.col[mask], upper.data[mask]):
+        if a == b:
+            pairs = combinations(groups[a], 2)
+        else:
+            pairs = ((min(i, j), max(i, j)) for i in groups[a] for j in groups[b])
+        for i, j in pairs:
+            yield {"source": file_ids[i], "target": file_ids[j], "weight": float(weight)}
+
+def _write_array(f, items):
+    # One compact object per line, written as produced so large lists are never serialised in one go
+    f.write(b"[")
+    for k, item in enumerate(items):
+        f.write(b"\n    " if k == 0 else b",\n    ")
+        f.write(orjson.dumps(item))
+    f.write(b"\n  ]")
+
+def _write_network(output_path, nodes, edges, debug):
+    with open(output_path, "wb") as f:
+        f.write(b'{\n  "nodes": ')
+        _write_array(f, nodes)
+        f.write(b',\n  "edges": ')
+        _write_array(f, edges)
+        f.write(b',\n  "debug": ')
+        f.write(orjson.dumps(debug))
+        f.write(b"\n}\n")
+
+def process_json_files(doi_safe, depth_level, threshold=SIMILARITY_THRESHOLD):
     # Paths based on dynamic DOI
     base_dir = "metadata"
     focal_file = os.path.join(base_dir, f"initial_data_{doi_safe}.json")
@@ -47,65 +163,57 @@ def process_json_files(doi_safe, depth_level):
     # Ensure results directory exists
     os.makedirs(results_dir, exist_ok=True)
 
-    # Load focal data
+    # Check focal data exists
     if not os.path.exists(focal_file):
         return {"status": f"Error: Focal file {focal_file} not found"}
-    with open(focal_file, "r") as f:
-        focal_data = json.load(f)
-
-    focal_id = focal_data.get("id", os.path.basename(focal_file).replace(".json", ""))
-    focal_title = focal_data.get("title", "No title available")
-    focal_abstract = focal_data.get("abstract", "No abstract available")
-    focal_text = f"{focal_title} {focal_abstract}"
-    focal_key_terms = extract_key_terms(focal_text)
 
     # Collect all reference files in the specified depth level
-    all_files = [os.path.join(ref_dir, f) for f in os.listdir(ref_dir) if f.endswith(".json") and f != os.path.basename(focal_file)] if os.path.exists(ref_dir) else []
+    all_files = []
+    if os.path.exists(ref_dir):
+        # scandir yields file type alongside each name, so no per-file stat or existence checks are needed
+        with os.scandir(ref_dir) as entries:
+            all_files = [entry.path for entry in entries
+                         if entry.is_file() and entry.name.endswith(".json") and entry.name != os.path.basename(focal_file)]
     all_files.insert(0, focal_file)
 
+    # Strip directory and ".json" suffix once; these names double as fallback work IDs and edge endpoints
+    file_names = [os.path.basename(f) for f in all_files]
+    file_ids = [name[:-len(".json")] for name in file_names]
+
     # Log the files being processed
-    status_info = f"Processing {len(all_files)} files: {', '.join([os.path.basename(f) for f in all_files])}"
+    status_info = f"Processing {len(all_files)} files: {', '.join(file_names)}"
 
     # Extract data from relevant files
-    works = {}
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        payloads = list(executor.map(_load_json, all_files))
+    entries = []
     texts = []
-    for file_path in all_files:
-        if not os.path.exists(file_path):
-            continue
-        with open(file_path, "r") as f:
-            data = json.load(f)
-        work_id = data.get("id", os.path.basename(file_path).replace(".json", ""))
+    for file_id, data in zip(file_ids, payloads):
+        work_id = data.get("id", file_id)
         title = data.get("title", "No title available")
         abstract = data.get("abstract", "No abstract available")
-        text = f"{title} {abstract}"
-        key_terms = extract_key_terms(text)
-        works[work_id] = {"title": title, "key_terms": key_terms}
-        texts.append(text)
+        entries.append((work_id, title))
+        texts.append(f"{title} {abstract}")
+
+    # Extract key terms for all distinct texts in a single batched spaCy pass
+    unique_texts = list(dict.fromkeys(texts))
+    key_terms = dict(zip(unique_texts, extract_all_key_terms(unique_texts)))
+    works = {}
+    for (work_id, title), text in zip(entries, texts):
+        works[work_id] = {"title": title, "key_terms": key_terms[text]}
 
     # Compute similarity matrix
-    similarity_matrix = compute_similarity_matrix(texts)
-    edges = []
-    if similarity_matrix.size > 0:
-        file_ids = [os.path.basename(f).replace(".json", "") for f in all_files]
-        for i in range(len(all_files)):
-            for j in range(i + 1, len(all_files)):
-                similarity = similarity_matrix[i, j]
-                if similarity > 0:
-                    edges.append({
-                        "source": file_ids[i],
-                        "target": file_ids[j],
-                        "weight": similarity
-                    })
+    similarity = compute_similarity_matrix(texts)
+    edges = iter(())
+    if similarity is not None:
+        # Only visit stored pairs on or above the diagonal above the threshold, lazily so the edge list is never held in memory
+        similarity_matrix, groups = similarity
+        edges = _iter_edges(similarity_matrix, groups, file_ids, threshold)
 
     # Prepare network output
-    network = {
-        "nodes": [{"id": work_id, "title": data["title"], "key_terms": data["key_terms"]} for work_id, data in works.items()],
-        "edges": edges,
-        "debug": status_info
-    }
+    nodes = [{"id": work_id, "title": data["title"], "key_terms": data["key_terms"]} for work_id, data in works.items()]
 
     # Save results
-    with open(output_path, "w") as f:
-        json.dump(network, f, indent=2)
+    _write_network(output_path, nodes, edges, status_info)
 
     return {"status":"Context of referenced works analysed"}
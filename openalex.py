@@ -1,83 +1,270 @@
 import asyncio
 import aiohttp
+import hashlib
+import orjson
+import os
 import re
+import time
+from email.utils import parsedate_to_datetime
 from typing import List, Dict, Optional, Union
 
+# OpenAlex polite pool allows ~10 requests per second, so never keep more than this many in flight
+MAX_CONCURRENT_REQUESTS = 10
+REQUESTS_PER_SECOND = 10
+REQUEST_TIMEOUT = 10
+# Throttled (429), transient server errors, timeouts and dropped connections are retried with exponential backoff,
+# or after the server's Retry-After when it sends one; waits longer than MAX_RETRY_AFTER (e.g. an exhausted daily quota)
+# fail the request instead
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 60
+# Only request the fields that are parsed below to keep payloads and decoding small
+SELECT_FIELDS = "id,title,abstract_inverted_index,authorships,publication_year,cited_by_count,primary_topic,referenced_works"
+# OpenAlex accepts up to 100 OR-ed filter values; 50 IDs fit in one page of results
+IDS_PER_REQUEST = 50
+# Title/abstract clean-up: strip <scp> small-caps tags and normalise Unicode hyphen and en dash to "-"
+_SCP_TAG = re.compile(r'<scp>(.*?)</scp>')
+_DASHES = str.maketrans({"\u2010": "-", "\u2013": "-"})
+# Parsed works waiting to be written to the cache; producers block once this many are queued
+WRITE_QUEUE_SIZE = 100
+
+# Parsed works are cached on disk so re-runs skip the network for anything fetched in the last 30 days
+CACHE_DIR = os.path.join("cache", "openalex")
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+def _cache_path(identifier: str) -> str:
+    """Cache file for a DOI or OpenAlex ID, named by a digest so distinct identifiers never share a file."""
+    key = identifier.split("/")[-1] if identifier.startswith("https://openalex.org/") else identifier
+    return os.path.join(CACHE_DIR, hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest() + ".json")
+
+def _read_cache(identifier: str) -> Optional[Dict]:
+    """Return the cached result for an identifier, or None if missing, stale or unreadable."""
+    path = _cache_path(identifier)
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_MAX_AGE:
+            return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(identifier: str, payload: bytes) -> None:
+    """Persist a serialised result for an identifier; caching failures are not fatal."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_cache_path(identifier), "wb") as f:
+            f.write(payload)
+    except OSError:
+        pass
+
+def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+    """Seconds the server asked to wait via Retry-After (delta-seconds or HTTP date), or None if absent or malformed."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time()) if retry_at is not None else None
+
+class _RateLimiter:
+    """Async leaky-bucket limiter spacing request starts evenly at `rate` per second."""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_allowed_time = 0.0
+
+    async def __aenter__(self):
+        # Reserve the next free slot before sleeping so concurrent callers queue up behind it
+        now = time.monotonic()
+        slot = max(now, self.next_allowed_time)
+        self.next_allowed_time = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+def _parse_work(work: Dict) -> Dict:
+    """Convert a raw OpenAlex work record into the metadata dictionary used by the app."""
+    # Process abstract (remove "abstract" and handle inverted index)
+    abstract_index = work.get("abstract_inverted_index", {})
+    if abstract_index:
+        # Drop each word straight into its position slot, which is linear and needs no sort
+        slots = [None] * (max((pos for positions in abstract_index.values() for pos in positions), default=-1) + 1)
+        for word, positions in abstract_index.items():
+            # Filter the "abstract" label once per distinct word rather than at every position
+            if word.lower() == "abstract":
+                continue
+            for pos in positions:
+                slots[pos] = word
+        words = [word for word in slots if word is not None]
+        abstract_text = " ".join(words) if words else "No abstract available"
+    else:
+        abstract_text = "No abstract available"
+
+    # Replace Unicode dashes with standard dash and <scp>text</scp> with text
+    abstract_text = _SCP_TAG.sub(r'\1', abstract_text.translate(_DASHES))
+    title = _SCP_TAG.sub(r'\1', work.get("title", "No title available").translate(_DASHES))
+
+    # Extract authors
+    authors = [{"name": author.get("author", {}).get("display_name", "Unknown")} 
+               for author in work.get("authorships", [])]
+
+    # Build result
+    # Topic levels may be missing or explicitly null, so resolve each once with a None-safe fallback
+    primary_topic = work.get("primary_topic") or {}
+    subfield = primary_topic.get("subfield") or {}
+    field = primary_topic.get("field") or {}
+    domain = primary_topic.get("domain") or {}
+    return {
+        "id": work.get("id", ""),
+        "title": title,
+        "abstract": abstract_text,
+        "authors": authors,
+        "publication_year": work.get("publication_year"),
+        "cited_by_count": work.get("cited_by_count", 0),
+        "primary_topic": primary_topic.get("display_name", "Unknown topic"),
+        "subfield_topic": subfield.get("display_name", "Unknown subfield"),
+        "field_topic": field.get("display_name", "Unknown field"),
+        "domain_topic": domain.get("display_name", "Unknown domain"),
+        "referenced_works": work.get("referenced_works", [])
+    }
+
 async def _fetch_openalex_data_batch(identifiers: List[str], email: Optional[str] = None) -> List[Dict]:
-    """Internal async function to fetch metadata from OpenAlex API for a list of DOIs or OpenAlex IDs in batches of 5."""
+    """Internal async function to fetch metadata from OpenAlex API for a list of DOIs or OpenAlex IDs over a single shared session.
+
+    OpenAlex IDs are requested IDS_PER_REQUEST at a time through an OR-ed `openalex` filter; DOIs are looked up one by one.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    limiter = _RateLimiter(REQUESTS_PER_SECOND)
+    write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+
+    async def cache_writer() -> None:
+        # Single consumer hands file writes to a worker thread so disk I/O never blocks the fetchers
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                break
+            await loop.run_in_executor(None, _write_cache, *item)
+
+    async def persist(identifier: str, result: Dict) -> None:
+        await write_queue.put((identifier, orjson.dumps(result)))
+
+    async def get_json(session: aiohttp.ClientSession, url: str, params: Dict) -> Dict:
+        params = dict(params, select=SELECT_FIELDS)
+        if email:
+            params["mailto"] = email
+        for attempt in range(MAX_RETRIES + 1):
+            delay = RETRY_BACKOFF * 2 ** attempt
+            try:
+                async with semaphore, limiter:
+                    async with session.get(url, params=params) as response:
+                        if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                            response.raise_for_status()
+                            return orjson.loads(await response.read())
+                        retry_after = _retry_after(response)
+                        if retry_after is not None:
+                            if retry_after > MAX_RETRY_AFTER:
+                                response.raise_for_status()
+                            delay = retry_after
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                if attempt == MAX_RETRIES:
+                    raise
+            # Sleep outside the semaphore so a waiting retry never holds a request slot
+            await asyncio.sleep(delay)
+
     async def fetch_single(session: aiohttp.ClientSession, identifier: str) -> Dict:
         # Set up base URL and parameters
         if identifier.startswith("https://openalex.org/"):
             work_id = identifier.split("/")[-1]
             url = f"https://api.openalex.org/works/{work_id}"
-            params = {"mailto": email} if email else {}
+            params = {}
         else:
             url = "https://api.openalex.org/works"
-            params = {"filter": f"doi:{identifier}", "mailto": email} if email else {"filter": f"doi:{identifier}"}
+            params = {"filter": f"doi:{identifier}"}
 
         try:
-            async with session.get(url, params=params, timeout=10) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                # Handle both single work and results list
-                work = data if "id" in data else data.get("results", [{}])[0]
-                if not work:
-                    return {"error": f"No results for {identifier}"}
-
-                # Process abstract (remove "abstract" and handle inverted index)
-                abstract_index = work.get("abstract_inverted_index", {})
-                if abstract_index:
-                    words_with_positions = [(pos, word) for word, positions in abstract_index.items() for pos in positions]
-                    words_with_positions.sort()
-                    words = [word for pos, word in words_with_positions if word.lower() != "abstract"]
-                    abstract_text = " ".join(words) if words else "No abstract available"
-                else:
-                    abstract_text = "No abstract available"
-
-                # Replace Unicode escapes with standard dash
-                abstract_text = abstract_text.replace("\u2010", "-").replace("\u2013", "-")
-                title = work.get("title", "No title available").replace("\u2010", "-").replace("\u2013", "-")
-
-                # Replace <scp>text</scp> with text
-                abstract_text = re.sub(r'<scp>(.*?)</scp>', r'\1', abstract_text)
-                title = re.sub(r'<scp>(.*?)</scp>', r'\1', title)
-
-                # Extract authors
-                authors = [{"name": author.get("author", {}).get("display_name", "Unknown")} 
-                           for author in work.get("authorships", [])]
-
-                # Build result
-                primary_topic = work.get("primary_topic", {}) or {}
-                return {
-                    "id": work.get("id", ""),
-                    "title": title,
-                    "abstract": abstract_text,
-                    "authors": authors,
-                    "publication_year": work.get("publication_year"),
-                    "cited_by_count": work.get("cited_by_count", 0),
-                    "primary_topic": primary_topic.get("display_name", "Unknown topic"),
-                    "subfield_topic": primary_topic.get("subfield", {}).get("display_name", "Unknown subfield"),
-                    "field_topic": primary_topic.get("field", {}).get("display_name", "Unknown field"),
-                    "domain_topic": primary_topic.get("domain", {}).get("display_name", "Unknown domain"),
-                    "referenced_works": work.get("referenced_works", [])
-                }
+            data = await get_json(session, url, params)
+
+            # Handle both single work and results list
+            work = data if "id" in data else data.get("results", [{}])[0]
+            if not work:
+                return {"error": f"No results for {identifier}"}
+
+            result = _parse_work(work)
+            await persist(identifier, result)
+            return result
         except Exception as e:
             return {"error": f"Failed to fetch {identifier}: {str(e)}"}
 
-    async def fetch_batch(batch: List[str]) -> List[Dict]:
-        async with aiohttp.ClientSession() as session:
-            tasks = [fetch_single(session, identifier) for identifier in batch]
-            return await asyncio.gather(*tasks, return_exceptions=True)
-
-    # Process identifiers in batches of 5
-    results = []
-    for i in range(0, len(identifiers), 10):
-        batch = identifiers[i:i + 10]
-        batch_results = await fetch_batch(batch)
-        results.extend(batch_results)
-    
-    return results
+    async def fetch_id_chunk(session: aiohttp.ClientSession, chunk: List[str]) -> Dict[str, Dict]:
+        work_ids = [identifier.split("/")[-1] for identifier in chunk]
+        params = {"filter": "openalex:" + "|".join(work_ids), "per-page": IDS_PER_REQUEST}
+        try:
+            data = await get_json(session, "https://api.openalex.org/works", params)
+            works = {work.get("id", "").split("/")[-1]: work for work in data.get("results", [])}
+        except Exception as e:
+            # A failed chunk is reported per ID rather than re-sent one by one, which would multiply the load on a throttled API
+            return {identifier: {"error": f"Failed to fetch {identifier}: {str(e)}"} for identifier in chunk}
+
+        results = {}
+        missing = []
+        for identifier, work_id in zip(chunk, work_ids):
+            if work_id in works:
+                try:
+                    results[identifier] = _parse_work(works[work_id])
+                    await persist(identifier, results[identifier])
+                except Exception as e:
+                    results[identifier] = {"error": f"Failed to fetch {identifier}: {str(e)}"}
+            else:
+                missing.append(identifier)
+        # IDs missing from a successful filter response (e.g. merged works) fall back to /works/{id}, which follows redirects
+        fallback = await asyncio.gather(*(fetch_single(session, identifier) for identifier in missing))
+        results.update(zip(missing, fallback))
+        return results
+
+    # Serve cached works from disk and split the rest into OpenAlex ID chunks and DOI lookups
+    results = {}
+    pending_ids = []
+    pending_dois = []
+    for identifier in dict.fromkeys(identifiers):
+        cached = _read_cache(identifier)
+        if cached is not None:
+            results[identifier] = cached
+        elif identifier.startswith("https://openalex.org/"):
+            pending_ids.append(identifier)
+        else:
+            pending_dois.append(identifier)
+    chunks = [pending_ids[i:i + IDS_PER_REQUEST] for i in range(0, len(pending_ids), IDS_PER_REQUEST)]
+
+    # Reuse one session (and its keep-alive connections) for every request
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    headers = {"User-Agent": f"biblio-bridge (mailto:{email})" if email else "biblio-bridge"}
+    # Pool sized to the request semaphore so every in-flight request gets a kept-alive connection; cache DNS for the crawl
+    connector = aiohttp.TCPConnector(limit=2 * MAX_CONCURRENT_REQUESTS, limit_per_host=MAX_CONCURRENT_REQUESTS, ttl_dns_cache=300)
+    writer = asyncio.ensure_future(cache_writer())
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            chunk_results, doi_results = await asyncio.gather(
+                asyncio.gather(*(fetch_id_chunk(session, chunk) for chunk in chunks)),
+                asyncio.gather(*(fetch_single(session, doi) for doi in pending_dois))
+            )
+    finally:
+        # Stop the writer on every exit path so a failed fetch never leaves it pending; queued entries are still flushed
+        if not writer.done():
+            await write_queue.put(None)
+        await writer
+    for chunk_result in chunk_results:
+        results.update(chunk_result)
+    results.update(zip(pending_dois, doi_results))
+
+    return [results[identifier] for identifier in identifiers]
 
 def fetch_openalex_data_batch(identifier: Union[str, List[str]], email: Optional[str] = None) -> Union[Dict, List[Dict]]:
     """Synchronous wrapper to fetch metadata from OpenAlex API for a single DOI/OpenAlex ID or a list of them.